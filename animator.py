@@ -1,17 +1,25 @@
+import os
+import tempfile
+
 import numpy as np
+import imageio_ffmpeg
 import matplotlib.pyplot as plt
 from matplotlib.animation import FuncAnimation
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 
-def create_race_animation(lap_times_str_dict):
+def _setup_race_figure(race_lap_times):
     """
-    Takes a lap_times dictionary (with string times) and returns
-    a matplotlib FuncAnimation object.
+    Takes the race's lap times, either as a 2D array indexed [car_id, lap]
+    or a dictionary ({car_id: [lap1_time, ...]}, as floats or numeric
+    strings), and builds the race figure. Returns the figure, its init
+    and update functions, and the number of frames.
     """
     
     # --- 1. Data Preparation ---
-    lap_times = {}
-    for car, times in lap_times_str_dict.items():
-        lap_times[car] = [float(t) for t in times]
+    if isinstance(race_lap_times, dict):
+        lap_times = {car: np.asarray(times, dtype=np.float64) for car, times in race_lap_times.items()}
+    else:
+        lap_times = dict(enumerate(np.asarray(race_lap_times, dtype=np.float64)))
         
     num_cars = len(lap_times)
     colors = ['red', 'green', 'blue', 'orange', 'purple', 'cyan']
@@ -24,36 +32,43 @@ def create_race_animation(lap_times_str_dict):
         car_lap_end_times[car_id] = cumulative_times
         max_race_time = max(max_race_time, cumulative_times[-1])
 
-    # --- 2. Position Calculation Function ---
-    def get_car_position(car_id, t):
+    dt = 0.5  # Each frame represents 0.5 seconds
+    # The animation ends as soon as the slowest car finishes
+    total_frames = int(max_race_time / dt) + 1
+
+    # --- 2. Precompute Car Positions ---
+    # Positions for every car and frame are computed once up front, so the
+    # per-frame update is a plain array lookup with no Python math.
+    T = np.arange(total_frames, dtype=np.float64) * dt
+    angles = np.empty((num_cars, total_frames))
+
+    for car_id in range(num_cars):
         lap_ends = car_lap_end_times[car_id]
         lap_durations = lap_times[car_id]
-        radius = lanes[car_id]
+        num_laps = len(lap_ends)
 
-        current_lap_index = np.searchsorted(lap_ends, t)
+        # Frame f is in the first lap whose end time is >= f*dt, so each lap's
+        # frame range follows directly from the cumulative lap end times.
+        lap_end_frames = np.minimum(np.floor(lap_ends / dt).astype(int) + 1, total_frames)
+        frames_per_lap = np.diff(lap_end_frames, prepend=0)
+        lap_index = np.repeat(np.arange(num_laps), frames_per_lap)
 
-        if current_lap_index >= len(lap_ends):
-            return (0, radius) # Finished
+        # Only the frames before this car finishes need the lap math
+        racing = lap_end_frames[-1]
+        lap_start_time = np.concatenate(([0.0], lap_ends[:-1]))[lap_index]
+        lap_duration = lap_durations[lap_index]
 
-        lap_start_time = 0.0
-        if current_lap_index > 0:
-            lap_start_time = lap_ends[current_lap_index - 1]
-        
-        lap_duration = lap_durations[current_lap_index]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            progress_percent = np.where(lap_duration == 0, 1.0, (T[:racing] - lap_start_time) / lap_duration)
 
-        if lap_duration == 0:
-            progress_percent = 1.0
-        else:
-            time_into_lap = t - lap_start_time
-            progress_percent = time_into_lap / lap_duration
+        angles[car_id, :racing] = (lap_index + progress_percent) * 2 * np.pi
+        angles[car_id, racing:] = 0.0 # Finished: parked on the start line
 
-        total_progress_in_laps = current_lap_index + progress_percent
-        
-        angle = total_progress_in_laps * 2 * np.pi
-        x = radius * np.sin(angle)
-        y = radius * np.cos(angle)
-        
-        return (x, y)
+    # One batched sin/cos call over every car and frame
+    radii = np.asarray(lanes[:num_cars])[:, None]
+    sin_table = np.sin(angles)
+    cos_table = np.cos(angles)
+    positions = np.stack([radii * sin_table, radii * cos_table], axis=-1)
 
     # --- 3. Animation Setup ---
     fig, ax = plt.subplots(figsize=(7, 7))
@@ -61,6 +76,8 @@ def create_race_animation(lap_times_str_dict):
     ax.set_xlim(-1.3, 1.3)
     ax.set_ylim(-1.3, 1.3)
     ax.axis('off')
+    ax.set_autoscale_on(False) # Fixed limits, nothing to recompute per frame
+    ax.set_navigate(False)
 
     for r in lanes[:num_cars]:
         track = plt.Circle((0, 0), r, color='black', fill=False, linestyle='--')
@@ -68,45 +85,90 @@ def create_race_animation(lap_times_str_dict):
 
     ax.plot([0, 0], [lanes[num_cars-1] - 0.03, lanes[0] + 0.03], color='black', linewidth=3, zorder=0)
 
-    car_plots = []
-    for i in range(num_cars):
-        plot, = ax.plot([], [], marker='o', markersize=12, color=colors[i], label=f'Car {i}')
-        car_plots.append(plot)
+    # Only the cars and the clock move. Marking them animated keeps them out of
+    # the cached blit background, so the tracks, start line and labels are
+    # rasterized once and restored each frame instead of being redrawn.
+    # All cars share one scatter artist, so each frame is a single draw call.
+    cars_scatter = ax.scatter(positions[:, 0, 0], positions[:, 0, 1], s=144, c=colors[:num_cars], animated=True)
 
-    time_text = ax.text(0.5, 1.02, '', transform=ax.transAxes, ha='center', fontsize=14)
-    ax.legend(loc='upper right')
+    # Kept inside the axes bbox, which is the region blitting restores
+    time_text = ax.text(0.5, 0.96, '', transform=ax.transAxes, ha='center', fontsize=14, animated=True)
+    # Plain text labels instead of ax.legend(), which is a heavier artist
+    for i in range(num_cars):
+        ax.text(0.98, 0.98 - 0.05*i, f'● Car {i}', transform=ax.transAxes,
+                ha='right', va='top', color=colors[i], fontsize=12)
 
     # --- 4. Animation Functions (init and update) ---
     def init():
-        for plot in car_plots:
-            plot.set_data([], [])
+        cars_scatter.set_offsets(positions[:, 0, :])
         time_text.set_text('')
-        return *car_plots, time_text
-
-    dt = 0.5  # Each frame represents 0.5 seconds
-    total_frames = int(max_race_time / dt) + 1
+        return cars_scatter, time_text
 
     def update(frame):
         t = frame * dt
         time_text.set_text(f'Time: {t:.1f}s')
-        
-        for car_id in range(num_cars):
-            x, y = get_car_position(car_id, t)
-            car_plots[car_id].set_data([x], [y])
-            
-        return *car_plots, time_text
+        cars_scatter.set_offsets(positions[:, frame, :])
+        return cars_scatter, time_text
+
+    return fig, init, update, total_frames
+
+def create_race_animation(race_lap_times):
+    """
+    Takes the race's lap times (see _setup_race_figure) and returns
+    a matplotlib FuncAnimation object.
+    """
+    fig, init, update, total_frames = _setup_race_figure(race_lap_times)
 
     # --- 5. Create and Return Animation ---
-    plt.rcParams['animation.embed_limit'] = 50.0 # 50 MB limit
-    
     anim = FuncAnimation(
         fig,
         update,
         frames=total_frames,
         init_func=init,
         blit=True,
-        interval=20 # 50fps
+        interval=20, # 50fps
+        cache_frame_data=False # Frames are cheap to regenerate; don't keep them
     )
     
     plt.close(fig) # Close the static plot
     return anim
+
+def render_race_video(race_lap_times, fps=50, dpi=72):
+    """
+    Takes the race's lap times (see _setup_race_figure) and renders the
+    race straight to an H.264 MP4, returning the file's bytes.
+    Each frame restores the cached static background, draws only the moving
+    artists and pipes the raw RGBA buffer to ffmpeg, so no frame is ever
+    PNG-encoded or held in memory.
+    """
+    fig, init, update, total_frames = _setup_race_figure(race_lap_times)
+    try:
+        fig.set_dpi(dpi) # 7in at 72dpi: 504x504 frames
+        canvas = FigureCanvasAgg(fig)
+
+        # Animated artists are skipped here, so this caches just the background
+        init()
+        canvas.draw()
+        background = canvas.copy_from_bbox(fig.bbox)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'race.mp4')
+            writer = imageio_ffmpeg.write_frames(
+                path, canvas.get_width_height(), pix_fmt_in='rgba', fps=fps,
+                macro_block_size=2 # yuv420p only needs even dimensions
+            )
+            try:
+                writer.send(None) # Start the ffmpeg process
+
+                for frame in range(total_frames):
+                    canvas.restore_region(background)
+                    for artist in update(frame):
+                        fig.draw_artist(artist)
+                    writer.send(canvas.buffer_rgba())
+            finally:
+                writer.close() # Always stop ffmpeg, even if a frame fails
+
+            with open(path, 'rb') as f:
+                return f.read()
+    finally:
+        plt.close(fig)
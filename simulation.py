@@ -1,7 +1,6 @@
 import numpy as np
-import copy
 import random
-from itertools import product, combinations
+from itertools import product
 
 # QUBO Solver Imports
 import dimod
@@ -11,6 +10,35 @@ from neal import SimulatedAnnealingSampler
 # 1. SIMULATOR CORE
 # ==============================================================================
 
+# Tyre model, indexed by compound id
+COMPOUND_IDS = {'Soft': 0, 'Medium': 1, 'Hard': 2}
+BASE_LAP_TIMES = np.array([80.0, 80.8, 81.5])
+DEGRADATION_RATES = np.array([0.40, 0.15, 0.08]) # Soft degrades very fast
+PIT_COMPOUND_ID = COMPOUND_IDS['Medium'] # STRATEGY RULE: Must fit a new compound
+
+def _compound_id(compound):
+    """Maps a compound name to its tyre model index ('Hard' or other -> Hard)."""
+    return COMPOUND_IDS.get(compound, COMPOUND_IDS['Hard'])
+
+def _simulate(compound_ids, pit_mask, total_laps, pit_lane_time, base_times, deg_rates, out_lap_times):
+    """
+    Array kernel for the race: steps through the laps and updates every car
+    at once. pit_mask[car, lap - 1] is True when the car pits on that lap.
+    Writes into out_lap_times[car, lap - 1] and returns it.
+    """
+    compound = np.array(compound_ids, dtype=np.intp)
+    tyre_age = np.zeros(len(compound))
+
+    for lap in range(total_laps):
+        pitting = pit_mask[:, lap]
+        lap_time = base_times[compound] + tyre_age * deg_rates[compound]
+        out_lap_times[:, lap] = np.where(pitting, lap_time + pit_lane_time, lap_time)
+
+        tyre_age = np.where(pitting, 0.0, tyre_age + 1)
+        compound = np.where(pitting, PIT_COMPOUND_ID, compound)
+
+    return out_lap_times
+
 class Car:
     """
     Represents a car agent, holding its state and decision logic.
@@ -23,22 +51,43 @@ class Car:
         self.initial_compound = initial_compound
         self.reset() # Set initial state
 
+    @property
+    def initial_compound_id(self):
+        """Tyre model index of initial_compound."""
+        return _compound_id(self.initial_compound)
+
+    @property
+    def strategy(self):
+        return self._strategy
+
+    @strategy.setter
+    def strategy(self, strategy):
+        self.set_strategy(strategy)
+
+    def set_strategy(self, strategy):
+        """
+        Sets the pit strategy (None, a lap number or a list of laps) and
+        precomputes pit_laps, the sorted array of laps the car pits on.
+        The Simulator turns these into its pit mask for the race length.
+        """
+        self._strategy = strategy
+        if strategy is None:
+            pit_laps = [] # No strategy, never pit
+        elif isinstance(strategy, (int, np.integer)):
+            pit_laps = [strategy]
+        else:
+            pit_laps = list(strategy)
+        self.pit_laps = np.unique(np.asarray([lap for lap in pit_laps if lap > 0], dtype=np.int64))
+
     def decide_pit_stop(self, current_lap):
         """
         Agent's brain. Decides whether to pit on this lap.
         """
-        if self.strategy is None:
-            return False # No strategy, never pit
-        if isinstance(self.strategy, int):
-            return current_lap == self.strategy
-        if isinstance(self.strategy, list):
-            return current_lap in self.strategy
+        return bool(np.any(self.pit_laps == current_lap))
 
     def reset(self):
         """Resets the car's state for a new simulation."""
-        self.tyre_age = 0
         self.total_race_time = 0.0
-        self.compound = self.initial_compound
 
 
 class Simulator:
@@ -49,97 +98,121 @@ class Simulator:
         self.cars = cars
         self.total_laps = total_laps
         self.pit_lane_time = pit_lane_time
-
-    def _calculate_lap_time(self, car):
-        """
-        Calculates a car's lap time based on its compound and tyre age.
-        """
-        if car.compound == 'Soft':
-            base_lap_time = 80.0
-            tyre_degradation_rate = 0.40 # Degrades very fast
-        elif car.compound == 'Medium':
-            base_lap_time = 80.8
-            tyre_degradation_rate = 0.15 # Degrades slowly
-        else: # 'Hard' or other
-            base_lap_time = 81.5
-            tyre_degradation_rate = 0.08
-            
-        tyre_degradation_penalty = car.tyre_age * car.tyre_degradation_rate
-        lap_time = base_lap_time + tyre_degradation_penalty
-        return lap_time
+        # Kernel state, built once and reused by every run. Rows follow
+        # self.cars order and columns are lap - 1.
+        self.compound_ids = np.empty(len(cars), dtype=np.intp)
+        self.pit_mask = np.zeros((len(cars), total_laps), dtype=bool)
+        self.lap_times = np.empty((len(cars), total_laps))
 
     def run_simulation(self):
         """
         Runs the full race from lap 1 to total_laps.
         Returns:
-            lap_time_storage (dict): {car_id: [lap1_time, lap2_time, ...]}
+            lap_times (ndarray): lap_times[car_idx, lap - 1] in seconds, rows in
+                self.cars order.
             total_race_times (dict): {car_id: total_time}
         """
         for car in self.cars:
             car.reset()
-            
-        lap_time_storage = {car.car_id: [] for car in self.cars}
-
-        for lap in range(1, self.total_laps + 1):
-            for car in self.cars:
-                
-                pit_decision = car.decide_pit_stop(lap)
-                
-                if pit_decision:
-                    lap_time = self._calculate_lap_time(car) + self.pit_lane_time
-                    car.tyre_age = 0
-                    # STRATEGY RULE: Must fit a new compound
-                    car.compound = 'Medium' 
-                else:
-                    lap_time = self._calculate_lap_time(car)
-                    car.tyre_age += 1
-                
-                car.total_race_time += lap_time
-                lap_time_storage[car.car_id].append(f"{lap_time:.2f}")
+
+        # Refill the kernel inputs in place from the cars' current settings
+        self.pit_mask[:] = False
+        for c, car in enumerate(self.cars):
+            self.compound_ids[c] = car.initial_compound_id
+            laps = car.pit_laps[:np.searchsorted(car.pit_laps, self.total_laps, side='right')]
+            self.pit_mask[c, laps - 1] = True
+
+        _simulate(self.compound_ids, self.pit_mask, self.total_laps, self.pit_lane_time,
+                  BASE_LAP_TIMES, DEGRADATION_RATES, self.lap_times)
+
+        for car, total in zip(self.cars, self.lap_times.sum(axis=1)):
+            car.total_race_time = float(total)
 
         total_race_times = {car.car_id: car.total_race_time for car in self.cars}
-        return lap_time_storage, total_race_times
+        return self.lap_times.copy(), total_race_times
 
 # ==============================================================================
 # 2. QUBO SOLVER LOGIC
 # ==============================================================================
 
+def _total_no_pit(base, deg, n_laps):
+    """
+    Race time for n_laps on one set of tyres fitted at age 0. Lap times
+    grow linearly with tyre age, so this is an arithmetic series.
+    """
+    return n_laps * base + deg * n_laps * (n_laps - 1) / 2
+
+def _total_with_pit(base_i, deg_i, base_m, deg_m, pit_lap, total_laps, pit_lane_time):
+    """
+    Race time when pitting on pit_lap: pit_lap laps on the initial set
+    (the pit lap included), the pit lane, then the rest on the new set.
+    """
+    return (_total_no_pit(base_i, deg_i, pit_lap)
+            + pit_lane_time
+            + _total_no_pit(base_m, deg_m, total_laps - pit_lap))
+
+def _build_q_matrix(compound_ids, pit_window, total_laps, pit_lane_time):
+    """
+    Returns q[car, k]: the extra race time for each car pitting on lap
+    pit_window[k], relative to its no-pit baseline. Computed in closed
+    form, so no race has to be simulated. A pit lap outside 1..total_laps
+    never happens in the race, so like the simulator its cost is 0.
+    """
+    base_i = BASE_LAP_TIMES[compound_ids][:, None]
+    deg_i = DEGRADATION_RATES[compound_ids][:, None]
+    base_m = BASE_LAP_TIMES[PIT_COMPOUND_ID]
+    deg_m = DEGRADATION_RATES[PIT_COMPOUND_ID]
+    pit_laps = np.asarray(pit_window)[None, :]
+
+    absolute_times = _total_with_pit(base_i, deg_i, base_m, deg_m, pit_laps, total_laps, pit_lane_time)
+    baseline_times = _total_no_pit(base_i, deg_i, total_laps)
+    in_race = (pit_laps >= 1) & (pit_laps <= total_laps)
+    return np.where(in_race, absolute_times - baseline_times, 0.0)
+
 def build_qubo(q, S, C, P1=500.0, P2=500.0):
     """
-    Builds the QUBO matrix from linear costs and constraints.
+    Builds the QUBO from linear costs and constraints as a dimod
+    BinaryQuadraticModel over variables 0..n-1, ready for the sampler.
     """
     cars = sorted({i for i,t in q.keys()})
     laps = sorted({t for i,t in q.keys()})
     vars_list = [(i,t) for i,t in product(cars, laps)]
     idx = {v:k for k,v in enumerate(vars_list)}
     n = len(vars_list)
-    Q = np.zeros((n,n))
+    num_laps = len(laps)
     
     # linear
-    for v in vars_list:
-        i,t = v
-        k = idx[v]
+    linear = np.empty(n)
+    for k, (i,t) in enumerate(vars_list):
         if i in S:
-            Q[k,k] += q.get(v, 0) + P1*(1 - 2*S[i]) + P2*(1 - 2*C)
+            linear[k] = q.get((i,t), 0) + P1*(1 - 2*S[i]) + P2*(1 - 2*C)
         else:
-            Q[k,k] += q.get(v, 0) + P2*(1 - 2*C)
-            
+            linear[k] = q.get((i,t), 0) + P2*(1 - 2*C)
+    rows, cols, vals = [], [], []
+
+    # vars_list is ordered by (car, lap), so idx[(i,t)] == car_index*num_laps + lap_index
+    def add_pairs(a, b, bias):
+        rows.extend([a, b])
+        cols.extend([b, a])
+        vals.extend([np.full(len(a), bias)] * 2)
+
     # quadratic: same car, different laps
-    for i in cars:
+    lap_a, lap_b = np.triu_indices(num_laps, 1)
+    for ci, i in enumerate(cars):
         if i not in S: continue
-        vars_i = [(i,t) for t in laps if (i,t) in idx]
-        for a,b in combinations(vars_i,2):
-            Q[idx[a], idx[b]] += 2*P1
-            Q[idx[b], idx[a]] += 2*P1
+        add_pairs(ci*num_laps + lap_a, ci*num_laps + lap_b, 2*P1)
             
     # quadratic: same lap, different cars (capacity)
-    for t in laps:
-        vars_t = [(i,t) for i in cars if (i,t) in idx]
-        for a,b in combinations(vars_t,2):
-            Q[idx[a], idx[b]] += 2*P2
-            Q[idx[b], idx[a]] += 2*P2
+    car_a, car_b = np.triu_indices(len(cars), 1)
+    lap_idx = np.arange(num_laps)
+    add_pairs((car_a[:, None]*num_laps + lap_idx).ravel(),
+              (car_b[:, None]*num_laps + lap_idx).ravel(), 2*P2)
+
+    # dimod sums duplicate and (b, a) entries, as a dense matrix would accumulate them
+    quadratic = (np.concatenate(rows), np.concatenate(cols), np.concatenate(vals))
+    bqm = dimod.BinaryQuadraticModel.from_numpy_vectors(linear, quadratic, 0.0, dimod.BINARY)
             
-    return Q, vars_list, idx
+    return bqm, vars_list, idx
 
 def get_optimized_schedule(cars, total_laps, pit_lane_time, pit_window, constraints):
     """
@@ -150,46 +223,27 @@ def get_optimized_schedule(cars, total_laps, pit_lane_time, pit_window, constrai
     P_STOPS = constraints['P1']
     P_CAPACITY = constraints['P2']
 
-    # --- A. Calculate the 'no-pit' baseline times ---
-    sim = Simulator(cars, total_laps, pit_lane_time)
-    no_pit_strategy = {car.car_id: [] for car in cars}
-    for car in cars:
-        car.strategy = no_pit_strategy[car.car_id]
-    _, no_pit_totals = sim.run_simulation()
-
-    # --- B. Generate the `q` cost matrix (as deltas) ---
-    q = {} 
-    for car in cars:
-        baseline_time = no_pit_totals[car.car_id]
-        
-        for lap_to_pit in pit_window:
-            temp_car = copy.deepcopy(car)
-            temp_car.strategy = lap_to_pit
-            temp_sim = Simulator([temp_car], total_laps, pit_lane_time)
-            
-            _, temp_totals = temp_sim.run_simulation()
-            
-            absolute_time = temp_totals[car.car_id]
-            q_delta = absolute_time - baseline_time
-            q[(car.car_id, lap_to_pit)] = q_delta
+    # --- A. Generate the `q` cost matrix (as deltas to the 'no-pit' times) ---
+    compound_ids = np.array([car.initial_compound_id for car in cars])
+    q_matrix = _build_q_matrix(compound_ids, pit_window, total_laps, pit_lane_time)
 
-    # --- C. Build and solve the QUBO (using NEAL) ---
-    Q, vars_list, idx = build_qubo(q, S, C, P1=P_STOPS, P2=P_CAPACITY)
-    n = Q.shape[0]
+    q = {}
+    for c, car in enumerate(cars):
+        for k, lap_to_pit in enumerate(pit_window):
+            q[(car.car_id, lap_to_pit)] = q_matrix[c, k]
 
-    Q_dict = {}
-    for i in range(n):
-        for j in range(n):
-            if Q[i, j] != 0:
-                Q_dict[(i, j)] = Q[i, j] 
+    # --- B. Build and solve the QUBO (using NEAL) ---
+    bqm, vars_list, idx = build_qubo(q, S, C, P1=P_STOPS, P2=P_CAPACITY)
+    n = len(vars_list)
 
+    # Fixed seed: the same race setup always yields the same schedule
     sampler = SimulatedAnnealingSampler()
-    response = sampler.sample_qubo(Q_dict, num_reads=10)
+    response = sampler.sample(bqm, num_reads=10, num_sweeps=1000, seed=42)
     best_sample = response.first.sample
     
     x = np.array([best_sample[i] for i in range(n)])
     
-    # --- D. Extract the schedule ---
+    # --- C. Extract the schedule ---
     qubo_solution = [vars_list[i] for i,val in enumerate(x) if val==1]
     
     optimized_strategy = {car.car_id: [] for car in cars}
@@ -3,7 +3,16 @@ import pandas as pd
 
 # Import your custom simulation and animation logic
 from simulation import Car, Simulator, get_optimized_schedule
-from animator import create_race_animation
+from animator import render_race_video
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def build_race_video(lap_times):
+    """
+    Renders the race MP4, cached on the lap times so reruns of an
+    identical race return instantly instead of re-rendering every frame.
+    Only the most recent few videos are kept, to bound memory use.
+    """
+    return render_race_video(lap_times)
 
 # ==============================================================================
 # 1. PAGE CONFIGURATION
@@ -106,8 +115,7 @@ if st.button("Run Baseline vs. Optimized Simulation"):
     with st.spinner("Generating race animation... (this may take a moment)"):
         st.subheader("Optimized Race Animation")
         
-        # Generate the animation
-        anim = create_race_animation(optimized_laps)
+        # Render the animation straight to an MP4
+        video = build_race_video(optimized_laps)
         
-        # Embed the animation as HTML5 video
-        st.components.v1.html(anim.to_jshtml(), height=800)
+        st.video(video, format="video/mp4")